@@ -1,9 +1,13 @@
 import logging
+from urllib.parse import urlparse
+from telegram import Update
 from telegram.ext import Application, ApplicationBuilder, Defaults
 from telegram.constants import ParseMode
 
-from src.config import APP_CONFIG
+from src.config import get_config
 from src.handlers import HANDLERS, error_handler
+from src.services.http_service import close_http_clients
+from src.state import close_state_store
 
 # Configure logging
 logging.basicConfig(
@@ -16,18 +20,31 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+# Only subscribe to the update types our handlers actually process, so Telegram
+# filters out edited messages, channel posts, etc. server-side.
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+
+async def _post_shutdown(application: Application) -> None:
+    """Releases the pooled Notion/OpenAI/Redis connections once the bot stops."""
+    await close_http_clients()
+    await close_state_store()
+
 
 def create_application() -> Application:
     """Creates and configures the Telegram Bot Application."""
     logger.info("Creating Telegram Application...")
 
-    # Set default parse mode for messages
-    defaults = Defaults(parse_mode=ParseMode.HTML)
+    # Set default parse mode for messages.
+    # block=False runs each handler callback as its own task, so a long audio
+    # job in one chat doesn't hold up updates from other chats.
+    defaults = Defaults(parse_mode=ParseMode.HTML, block=False)
 
     application = (
         ApplicationBuilder()
-        .token(APP_CONFIG.telegram_bot_token)
+        .token(get_config().telegram_bot_token)
         .defaults(defaults)
+        .post_shutdown(_post_shutdown)
         .build()
     )
 
@@ -43,8 +60,31 @@ def create_application() -> Application:
 
 
 def run_bot(application: Application) -> None:
-    """Starts the polling process for the bot."""
+    """Starts the bot in webhook mode if configured, otherwise long-polling."""
+    config = get_config()
+    if config.webhook_url:
+        logger.info("Starting bot webhook on port %s...", config.webhook_port)
+        # Telegram pushes updates to us, no polling round trips at all
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=config.webhook_port,
+            url_path=urlparse(config.webhook_url).path.lstrip("/"),
+            secret_token=config.webhook_secret,
+            webhook_url=config.webhook_url,
+            bootstrap_retries=-1,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        logger.info("Bot webhook stopped.")
+        return
+
     logger.info("Starting bot polling...")
-    # Run the bot until the user presses Ctrl-C
-    application.run_polling()
+    # Run the bot until the user presses Ctrl-C.
+    # Long-polling: getUpdates hangs open until Telegram has data, instead of
+    # issuing empty round trips.
+    application.run_polling(
+        poll_interval=0.0,
+        timeout=50,
+        bootstrap_retries=-1,
+        allowed_updates=ALLOWED_UPDATES,
+    )
     logger.info("Bot polling stopped.")
@@ -1,3 +1,4 @@
+import functools
 import os
 import logging
 from dotenv import load_dotenv
@@ -20,17 +21,28 @@ class AppConfig:
 
         self.telegram_bot_token: str = self._get_env_var("TELEGRAM_BOT_TOKEN")
         allowed_user_ids_str: str = self._get_env_var("ALLOWED_TELEGRAM_USER_IDS")
-        self.allowed_telegram_user_ids: list[int] = self._parse_int_list(
-            allowed_user_ids_str
+        # frozenset gives O(1) membership checks in the per-update auth gate
+        self.allowed_telegram_user_ids: frozenset[int] = frozenset(
+            self._parse_int_list(allowed_user_ids_str)
         )
+        # Computed once so the per-update auth gate is a plain attribute check
+        self.auth_required: bool = bool(self.allowed_telegram_user_ids)
 
         self.openai_api_key: str = self._get_env_var("OPENAI_API_KEY")
         self.openai_model_gpt: str = os.getenv("OPENAI_MODEL_GPT", "gpt-4o")
         self.openai_model_whisper: str = os.getenv("OPENAI_MODEL_WHISPER", "whisper-1")
 
         self.notion_api_key: str = self._get_env_var("NOTION_API_KEY")
-        self.notion_facts_database_id: str = self._get_env_var(
-            "NOTION_FACTS_DATABASE_ID"
+        # Optional page to append facts to as blocks, in bulk, instead of
+        # creating one database row per fact
+        self.notion_facts_page_id: str | None = (
+            os.getenv("NOTION_FACTS_PAGE_ID") or None
+        )
+        # The facts database is only required when facts go to database rows
+        self.notion_facts_database_id: str | None = (
+            os.getenv("NOTION_FACTS_DATABASE_ID")
+            if self.notion_facts_page_id
+            else self._get_env_var("NOTION_FACTS_DATABASE_ID")
         )
         # ID of the Notion page/database under which relevant documents for summaries reside
         self.notion_summary_parent_id: str = self._get_env_var(
@@ -55,7 +67,15 @@ class AppConfig:
             "NOTION_DB_PROPERTY_SOURCE_TEXT", "Source Text"
         )
 
-        if not self.allowed_telegram_user_ids:
+        # Optional webhook mode. When WEBHOOK_URL is unset the bot uses long-polling
+        self.webhook_url: str | None = os.getenv("WEBHOOK_URL") or None
+        self.webhook_secret: str | None = os.getenv("WEBHOOK_SECRET") or None
+        self.webhook_port: int = int(os.getenv("WEBHOOK_PORT", "8443"))
+
+        # Optional Redis for conversation state, shared across workers and restarts
+        self.redis_url: str | None = os.getenv("REDIS_URL") or None
+
+        if not self.auth_required:
             logger.warning(
                 "ALLOWED_TELEGRAM_USER_IDS is not set or empty. The bot will respond to anyone."
             )
@@ -64,7 +84,7 @@ class AppConfig:
         """Gets an environment variable or raises an error if not found."""
         value = os.getenv(var_name)
         if value is None:
-            logger.error(f"Environment variable '{var_name}' not found.")
+            logger.error("Environment variable '%s' not found.", var_name)
             raise ValueError(f"Missing required environment variable: {var_name}")
         return value
 
@@ -76,10 +96,12 @@ class AppConfig:
             return [int(item.strip()) for item in value.split(",")]
         except ValueError as e:
             logger.error(
-                f"Invalid format for integer list in env var: {value}. Error: {e}"
+                "Invalid format for integer list in env var: %s. Error: %s", value, e
             )
             raise ValueError(f"Invalid format for integer list: {value}")
 
 
-# Singleton instance
-APP_CONFIG = AppConfig()
+@functools.lru_cache(maxsize=1)
+def get_config() -> AppConfig:
+    """Returns the singleton config, loading it on first access."""
+    return AppConfig()
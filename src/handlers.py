@@ -1,5 +1,6 @@
+import asyncio
 import logging
-from telegram import Update, MessageEntity
+from telegram import Update
 from telegram.ext import (
     ContextTypes,
     MessageHandler,
@@ -9,7 +10,7 @@ from telegram.ext import (
 )
 from functools import wraps
 
-from src.config import APP_CONFIG
+from src.config import get_config
 from src.logic import (
     process_audio_message,
     process_text_message,
@@ -18,6 +19,7 @@ from src.logic import (
     handle_page_rejection_callback,
     handle_page_selection_callback,
     handle_new_page_callback,
+    serialized_per_chat,
 )
 from src.services import telegram_service
 from src.state import clear_user_state
@@ -38,12 +40,12 @@ def authorized_user_only(func):
             logger.warning("Cannot identify user in update.")
             return
 
-        if (
-            APP_CONFIG.allowed_telegram_user_ids
-            and user.id not in APP_CONFIG.allowed_telegram_user_ids
-        ):
+        config = get_config()
+        if config.auth_required and user.id not in config.allowed_telegram_user_ids:
             logger.warning(
-                f"Unauthorized access attempt by user ID: {user.id} ({user.username})"
+                "Unauthorized access attempt by user ID: %s (%s)",
+                user.id,
+                user.username,
             )
             return
         # User is authorized, proceed with the original function
@@ -54,11 +56,12 @@ def authorized_user_only(func):
 
 # --- Command Handlers ---
 @authorized_user_only
+@serialized_per_chat
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Sends a welcome message when the /start command is issued."""
     user = update.effective_user
-    logger.info(f"User {user.id} ({user.username}) started interaction.")
-    clear_user_state(update.effective_chat.id)  # Clear state on start
+    logger.info("User %s (%s) started interaction.", user.id, user.username)
+    await clear_user_state(update.effective_chat.id)  # Clear state on start
     await update.message.reply_html(
         rf"Hi {user.mention_html()}! I'm AuditLife bot. Send me text or voice notes to process and document.",
     )
@@ -78,13 +81,8 @@ async def text_message_handler(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
     """Handler for incoming text messages (excluding commands)."""
-    # Ignore commands handled elsewhere
-    if (
-        update.message
-        and update.message.entities
-        and any(e.type == MessageEntity.BOT_COMMAND for e in update.message.entities)
-    ):
-        return
+    # Texts containing a command anywhere are excluded by the
+    # `~filters.Command(False)` filter in HANDLERS
     await process_text_message(update, context)
 
 
@@ -97,6 +95,16 @@ async def audio_message_handler(
 
 
 # --- Callback Query Handler ---
+CALLBACK_ROUTES = {
+    telegram_service.CALLBACK_REJECT_PAGE: handle_page_rejection_callback,
+    telegram_service.CALLBACK_NEW_PAGE: handle_new_page_callback,
+}
+CALLBACK_PREFIX_ROUTES = (
+    (telegram_service.CALLBACK_CONFIRM_PAGE, handle_page_confirmation_callback),
+    (telegram_service.CALLBACK_SELECT_PAGE, handle_page_selection_callback),
+)
+
+
 @authorized_user_only
 async def button_callback_handler(
     update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -108,47 +116,69 @@ async def button_callback_handler(
         await query.answer("Error: No callback data received.")
         return
 
-    logger.debug(f"Received callback query with data: {query.data}")
-
-    # Route based on callback data prefix
-    if query.data.startswith(telegram_service.CALLBACK_CONFIRM_PAGE):
-        await handle_page_confirmation_callback(update, context)
-    elif query.data == telegram_service.CALLBACK_REJECT_PAGE:
-        await handle_page_rejection_callback(update, context)
-    elif query.data.startswith(telegram_service.CALLBACK_SELECT_PAGE):
-        await handle_page_selection_callback(update, context)
-    elif query.data == telegram_service.CALLBACK_NEW_PAGE:
-        await handle_new_page_callback(update, context)
+    logger.debug("Received callback query with data: %s", query.data)
+
+    # Route exact-match actions with a single dict lookup, then fall back to
+    # the prefixed actions that carry a page ID
+    route = CALLBACK_ROUTES.get(query.data)
+    if route is None:
+        route = next(
+            (
+                fn
+                for prefix, fn in CALLBACK_PREFIX_ROUTES
+                if query.data.startswith(prefix)
+            ),
+            None,
+        )
+
+    if route:
+        await route(update, context)
     else:
-        logger.warning(f"Unhandled callback query data: {query.data}")
+        logger.warning("Unhandled callback query data: %s", query.data)
         await query.answer("Unknown action.")  # Let the user know it wasn't processed
 
 
 # --- Error Handler ---
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def _send_error_notice(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    """Tells the user something went wrong, logging if that fails too."""
+    try:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="Sorry, an internal error occurred. Please try again later.",
+        )
+    except Exception as e:
+        logger.error("Failed to send error message to chat %s: %s", chat_id, e)
+
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Logs errors caused by Updates."""
     logger.error(
-        f"Update {update} caused error {context.error}", exc_info=context.error
+        "Update %s caused error %s", update, context.error, exc_info=context.error
     )
-    # Optionally notify user or admin
+    # Notify the user in the background so a slow or rate-limited Telegram API
+    # doesn't hold up error recovery
     if isinstance(update, Update) and update.effective_chat:
-        try:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Sorry, an internal error occurred. Please try again later.",
-            )
-        except Exception as e:
-            logger.error(
-                f"Failed to send error message to chat {update.effective_chat.id}: {e}"
-            )
+        task = asyncio.create_task(
+            _send_error_notice(context, update.effective_chat.id)
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
 
 
 # --- Define Handlers List ---
-# Order matters sometimes, especially for MessageHandlers
+# Order matters sometimes, especially for MessageHandlers.
+# All handlers share one group, so PTB stops at the first match; the frequent
+# update kinds come first and the rarely used commands last. The text filter
+# already excludes commands, so this ordering doesn't change routing.
 HANDLERS = [
-    CommandHandler("start", start_command),
-    CommandHandler("reset", reset_command_handler),
-    MessageHandler(filters.TEXT & ~filters.COMMAND, text_message_handler),
+    # Command(False) matches a bot command anywhere in the text, not just at the
+    # start, so e.g. "remind me to /reset later" is ignored too
+    MessageHandler(filters.TEXT & ~filters.Command(False), text_message_handler),
     MessageHandler(filters.AUDIO | filters.VOICE, audio_message_handler),
     CallbackQueryHandler(button_callback_handler),
+    CommandHandler("start", start_command),
+    CommandHandler("reset", reset_command_handler),
 ]
@@ -1,17 +1,21 @@
+import asyncio
+import io
 import logging
-import tempfile
-import os
+from collections import OrderedDict
+from typing import List, Optional
 from telegram import Audio, Update, Voice
 from telegram.ext import ContextTypes
+from functools import wraps
 
+from src.config import get_config
 from src.models import ProcessingResult, NotionPageInfo
 from src.services import openai_service, notion_service, telegram_service
 from src.state import (
+    PendingSummary,
     set_user_state,
     get_user_state,
     clear_user_state,
     store_pending_summary_data,
-    get_pending_summary_data,
     STATE_AWAITING_PAGE_CONFIRMATION,
     STATE_AWAITING_PAGE_SELECTION,
     STATE_AWAITING_NEW_PAGE_NAME,
@@ -19,7 +23,63 @@ from src.state import (
 
 logger = logging.getLogger(__name__)
 
+TRANSCRIPTION_PREVIEW_LENGTH = 1000
 
+# Small LRU of recent transcriptions, keyed by Telegram's file_unique_id
+TRANSCRIPT_CACHE_SIZE = 256
+_TRANSCRIPT_CACHE: OrderedDict[str, str] = OrderedDict()
+
+
+def serialized_per_chat(func):
+    """Decorator that runs calls for the same chat one at a time.
+
+    Handlers run concurrently (non-blocking), so this keeps per-chat ordering
+    while still allowing different chats to be processed in parallel. Every
+    handler that reads or changes a chat's state must take this lock, or e.g. a
+    double-tapped button would run its Notion write twice.
+    """
+
+    @wraps(func)
+    async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE, *args):
+        if context.chat_data is None:
+            return await func(update, context, *args)
+        lock = context.chat_data.setdefault("lock", asyncio.Lock())
+        async with lock:
+            return await func(update, context, *args)
+
+    return wrapped
+
+
+def _get_cached_transcription(file_unique_id: str) -> Optional[str]:
+    """Returns a previously transcribed text for this audio file, if any."""
+    transcribed_text = _TRANSCRIPT_CACHE.get(file_unique_id)
+    if transcribed_text is not None:
+        _TRANSCRIPT_CACHE.move_to_end(file_unique_id)
+        logger.info("Using cached transcription for audio %s.", file_unique_id)
+    return transcribed_text
+
+
+def _cache_transcription(file_unique_id: str, transcribed_text: str) -> None:
+    """Remembers a transcription, evicting the least recently used entry."""
+    _TRANSCRIPT_CACHE[file_unique_id] = transcribed_text
+    _TRANSCRIPT_CACHE.move_to_end(file_unique_id)
+    if len(_TRANSCRIPT_CACHE) > TRANSCRIPT_CACHE_SIZE:
+        _TRANSCRIPT_CACHE.popitem(last=False)
+
+
+async def _store_facts(processing_result: ProcessingResult) -> bool:
+    """Stores facts as blocks on the facts page if configured, else as DB rows."""
+    facts_page_id = get_config().notion_facts_page_id
+    if facts_page_id:
+        return await notion_service.add_facts_as_blocks(
+            facts_page_id, processing_result.facts
+        )
+    return await notion_service.add_facts_to_database(
+        processing_result.facts, processing_result.original_text
+    )
+
+
+@serialized_per_chat
 async def process_audio_message(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -34,50 +94,63 @@ async def process_audio_message(
     chat_id = update.effective_chat.id
     audio: Audio | Voice = update.message.audio or update.message.voice
 
-    # Use a temporary file to store the downloaded audio
-    try:
-        # Get the file object from Telegram
-        audio_file = await context.bot.get_file(audio.file_id)
-        # Create a temporary file with a proper suffix (e.g., .ogg if possible, or default)
-        # Telegram often sends voice notes as .ogg
-        suffix = ".ogg"
-        with tempfile.NamedTemporaryFile(
-            delete=False, suffix=suffix
-        ) as temp_audio_file:
-            await audio_file.download_to_drive(custom_path=temp_audio_file.name)
-            temp_audio_path = temp_audio_file.name
-            logger.info(f"Audio downloaded to temporary file: {temp_audio_path}")
-
-    except Exception as e:
-        logger.error(f"Failed to download audio file: {e}", exc_info=True)
-        await telegram_service.reply_text(
-            update, context, "Sorry, I couldn't download the audio file."
-        )
-        return
-
-    # Transcribe
-    await telegram_service.reply_text(update, context, "🎙️ Transcribing audio...")
-    transcribed_text = await openai_service.transcribe_audio(temp_audio_path)
+    # Re-forwarded or retried voice notes share a file_unique_id, skip Whisper
+    transcribed_text = _get_cached_transcription(audio.file_unique_id)
+    if transcribed_text is None:
+        # Download the audio straight into memory, no temporary file needed
+        try:
+            # Get the file object from Telegram
+            audio_file = await context.bot.get_file(audio.file_id)
+            audio_buffer = io.BytesIO()
+            await audio_file.download_to_memory(out=audio_buffer)
+            # Whisper infers the format from the file name.
+            # Telegram often sends voice notes as .ogg
+            audio_buffer.name = "voice.ogg"
+            logger.info("Audio downloaded to memory (%s bytes).", audio_buffer.tell())
+            audio_buffer.seek(0)
+
+        except Exception as e:
+            logger.error("Failed to download audio file: %s", e, exc_info=True)
+            await telegram_service.reply_text(
+                update, context, "Sorry, I couldn't download the audio file."
+            )
+            return
 
-    # Clean up the temporary file
-    try:
-        os.remove(temp_audio_path)
-        logger.info(f"Temporary audio file removed: {temp_audio_path}")
-    except OSError as e:
-        logger.error(f"Error removing temporary audio file {temp_audio_path}: {e}")
+        # Transcribe, and warm the summary page cache for the next step meanwhile
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(
+                telegram_service.reply_text(update, context, "🎙️ Transcribing audio...")
+            )
+            tg.create_task(notion_service.list_pages_under_parent())
+            transcription_task = tg.create_task(
+                openai_service.transcribe_audio_bytes(audio_buffer)
+            )
+        transcribed_text = transcription_task.result()
+        if transcribed_text:
+            _cache_transcription(audio.file_unique_id, transcribed_text)
 
     if transcribed_text:
-        await telegram_service.reply_text(
-            update, context, f"Transcription:\n\n{transcribed_text[:1000]}..."
-        )  # Show preview
-        # Now process the text
-        await process_text_input(update, context, transcribed_text)
+        preview = (
+            transcribed_text
+            if len(transcribed_text) <= TRANSCRIPTION_PREVIEW_LENGTH
+            else transcribed_text[:TRANSCRIPTION_PREVIEW_LENGTH] + "…"
+        )
+        # Show the preview while the text is already being processed. A
+        # TaskGroup cancels the sibling on failure, so nothing outlives the lock.
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(
+                telegram_service.reply_text(
+                    update, context, f"Transcription:\n\n{preview}"
+                )
+            )
+            tg.create_task(process_text_input(update, context, transcribed_text))
     else:
         await telegram_service.reply_text(
             update, context, "Sorry, I couldn't transcribe the audio. Please try again."
         )
 
 
+@serialized_per_chat
 async def process_text_message(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -89,7 +162,7 @@ async def process_text_message(
     text = update.message.text
     # Check if the user is providing a name for a new page
     chat_id = update.effective_chat.id
-    current_state, state_data = get_user_state(chat_id)
+    current_state, state_data = await get_user_state(chat_id)
 
     if current_state == STATE_AWAITING_NEW_PAGE_NAME:
         await handle_new_page_name_input(update, context, text, state_data)
@@ -107,9 +180,15 @@ async def process_text_input(
         return
     chat_id = update.effective_chat.id
 
-    # 1. Process with LLM (Translate, Facts, Summary)
-    await telegram_service.reply_text(update, context, "🧠 Processing text...")
-    processing_result = await openai_service.process_text_with_llm(text)
+    # 1. Process with LLM (Translate, Facts, Summary). The candidate summary
+    # pages don't depend on its output, so list them while the LLM runs.
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(
+            telegram_service.reply_text(update, context, "🧠 Processing text...")
+        )
+        llm_task = tg.create_task(openai_service.process_text_with_llm(text))
+        pages_task = tg.create_task(notion_service.list_pages_under_parent())
+    processing_result = llm_task.result()
 
     if not processing_result:
         await telegram_service.reply_text(
@@ -117,19 +196,30 @@ async def process_text_input(
             context,
             "Sorry, I encountered an error processing the text with the AI.",
         )
-        clear_user_state(chat_id)
+        await clear_user_state(chat_id)
         return
 
     # 2. Store Facts in Notion
-    if processing_result.facts:
-        await telegram_service.reply_text(
-            update,
-            context,
-            f"📝 Found {len(processing_result.facts)} facts. Adding to Notion database...",
-        )
-        success = await notion_service.add_facts_to_database(
-            processing_result.facts, processing_result.original_text
+    summary = processing_result.summary
+    has_facts = bool(processing_result.facts)
+    status_messages = [
+        f"📝 Found {len(processing_result.facts)} facts. Adding to Notion database..."
+        if has_facts
+        else "No specific facts extracted to add."
+    ]
+    if summary:
+        status_messages.append(" Lising relevant Notion pages for the summary...")
+    # The status replies go out while the facts are written. A TaskGroup cancels
+    # the write if a reply fails, so nothing keeps running outside the chat lock.
+    async with asyncio.TaskGroup() as tg:
+        facts_task = (
+            tg.create_task(_store_facts(processing_result)) if has_facts else None
         )
+        for message in status_messages:
+            tg.create_task(telegram_service.reply_text(update, context, message))
+
+    if facts_task:
+        success = facts_task.result()
         if success:
             await telegram_service.reply_text(
                 update, context, "✅ Facts successfully added to Notion."
@@ -140,29 +230,21 @@ async def process_text_input(
                 context,
                 "⚠️ Could not add all facts to Notion. Please check logs.",
             )
-    else:
-        await telegram_service.reply_text(
-            update, context, "No specific facts extracted to add."
-        )
 
     # 3. Handle Summary - Suggest Page
-    summary = processing_result.summary
     if not summary:
         await telegram_service.reply_text(update, context, "No summary was generated.")
-        clear_user_state(chat_id)
+        await clear_user_state(chat_id)
         return
 
-    await telegram_service.reply_text(
-        update, context, " Lising relevant Notion pages for the summary..."
-    )
-    page_options = await notion_service.list_pages_under_parent()
+    page_options = pages_task.result()
 
     if not page_options:
         # No pages found, ask to create new directly
         logger.info("No existing pages found. Prompting to create a new page.")
         # Store data needed if user confirms creation
-        state_data = {"processing_result": processing_result.model_dump()}
-        set_user_state(
+        state_data = PendingSummary(processing_result)
+        await set_user_state(
             chat_id, STATE_AWAITING_NEW_PAGE_NAME, state_data
         )  # Awaiting name directly
         await telegram_service.request_new_page_name(update, context)  # Ask for name
@@ -174,11 +256,13 @@ async def process_text_input(
         # Simple approach: Suggest the first one (most recently edited based on query sort)
         suggested_page = page_options[0]
         logger.info(
-            f"Suggesting page '{suggested_page.title}' (ID: {suggested_page.id}) for summary."
+            "Suggesting page '%s' (ID: %s) for summary.",
+            suggested_page.title,
+            suggested_page.id,
         )
 
         # Store state and data for confirmation
-        store_pending_summary_data(
+        await store_pending_summary_data(
             chat_id, processing_result, suggested_page, page_options
         )
 
@@ -188,6 +272,7 @@ async def process_text_input(
         )
 
 
+@serialized_per_chat
 async def handle_page_confirmation_callback(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -195,10 +280,12 @@ async def handle_page_confirmation_callback(
     query = update.callback_query
     await query.answer()  # Acknowledge button press
 
-    if not query.data or not query.data.startswith(
+    # Strip the prefix in one pass; an unchanged string means it wasn't there
+    page_id_to_confirm = (query.data or "").removeprefix(
         telegram_service.CALLBACK_CONFIRM_PAGE
-    ):
-        logger.warning(f"Invalid callback data for confirmation: {query.data}")
+    )
+    if not page_id_to_confirm or page_id_to_confirm == query.data:
+        logger.warning("Invalid callback data for confirmation: %s", query.data)
         await query.edit_message_text(text="Something went wrong. Please try again.")
         return
 
@@ -207,39 +294,32 @@ async def handle_page_confirmation_callback(
         return
     chat_id = update.effective_chat.id
 
-    page_id_to_confirm = query.data[len(telegram_service.CALLBACK_CONFIRM_PAGE) :]
-    state, stored_data = get_user_state(chat_id)
-    pending_data = get_pending_summary_data(chat_id)  # Gets data if state is correct
+    # The state check below guarantees this is the pending summary
+    state, pending_data = await get_user_state(chat_id)
 
     if state != STATE_AWAITING_PAGE_CONFIRMATION or not pending_data:
         logger.warning(
-            f"Received page confirmation callback in unexpected state: {state}"
+            "Received page confirmation callback in unexpected state: %s", state
         )
         await query.edit_message_text(
             text="Your request might have timed out or is out of order. Please send the input again."
         )
-        clear_user_state(chat_id)
+        await clear_user_state(chat_id)
         return
 
-    # Reconstruct needed objects from stored dictionaries
-    try:
-        processing_result = ProcessingResult(**pending_data["processing_result"])
-        suggested_page = NotionPageInfo(**pending_data["suggested_page"])
-    except Exception as e:
-        logger.error(f"Failed to reconstruct data from state: {e}", exc_info=True)
-        await query.edit_message_text(
-            text="Internal error loading data. Please try again."
-        )
-        clear_user_state(chat_id)
-        return
+    # State holds the live objects, no reconstruction needed
+    processing_result: ProcessingResult = pending_data.processing_result
+    suggested_page: NotionPageInfo = pending_data.suggested_page
 
     if suggested_page.id != page_id_to_confirm:
         logger.warning(
-            f"Confirmation ID mismatch. Expected {suggested_page.id}, got {page_id_to_confirm}"
+            "Confirmation ID mismatch. Expected %s, got %s",
+            suggested_page.id,
+            page_id_to_confirm,
         )
         await query.edit_message_text(text="Confirmation mismatch. Please try again.")
         # Keep state for potential retry or selection? Or clear? Clearing is safer.
-        clear_user_state(chat_id)
+        await clear_user_state(chat_id)
         return
 
     # User confirmed, append summary to the suggested page
@@ -259,9 +339,10 @@ async def handle_page_confirmation_callback(
             text=f"⚠️ Failed to add summary to Notion page '{suggested_page.title}'."
         )
 
-    clear_user_state(chat_id)
+    await clear_user_state(chat_id)
 
 
+@serialized_per_chat
 async def handle_page_rejection_callback(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -274,38 +355,29 @@ async def handle_page_rejection_callback(
         return
     chat_id = update.effective_chat.id
 
-    state, stored_data = get_user_state(chat_id)
-    pending_data = get_pending_summary_data(chat_id)
+    # The state check below guarantees this is the pending summary
+    state, pending_data = await get_user_state(chat_id)
 
     if state != STATE_AWAITING_PAGE_CONFIRMATION or not pending_data:
-        logger.warning(f"Received page rejection callback in unexpected state: {state}")
+        logger.warning(
+            "Received page rejection callback in unexpected state: %s", state
+        )
         await query.edit_message_text(
             text="Your request might have timed out or is out of order. Please send the input again."
         )
-        clear_user_state(chat_id)
+        await clear_user_state(chat_id)
         return
 
-    # Reconstruct page options from stored data
-    try:
-        page_options_data = pending_data.get("page_options", [])
-        page_options = [NotionPageInfo(**p) for p in page_options_data]
-    except Exception as e:
-        logger.error(
-            f"Failed to reconstruct page options from state: {e}", exc_info=True
-        )
-        await query.edit_message_text(
-            text="Internal error loading page options. Please try again."
-        )
-        clear_user_state(chat_id)
-        return
+    page_options: List[NotionPageInfo] = pending_data.page_options
 
     # Transition state and show selection prompt
-    set_user_state(
-        chat_id, STATE_AWAITING_PAGE_SELECTION, stored_data
+    await set_user_state(
+        chat_id, STATE_AWAITING_PAGE_SELECTION, pending_data
     )  # Keep data, change state
     await telegram_service.send_page_selection_prompt(update, context, page_options)
 
 
+@serialized_per_chat
 async def handle_page_selection_callback(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -313,10 +385,12 @@ async def handle_page_selection_callback(
     query = update.callback_query
     await query.answer()
 
-    if not query.data or not query.data.startswith(
+    # Strip the prefix in one pass; an unchanged string means it wasn't there
+    selected_page_id = (query.data or "").removeprefix(
         telegram_service.CALLBACK_SELECT_PAGE
-    ):
-        logger.warning(f"Invalid callback data for page selection: {query.data}")
+    )
+    if not selected_page_id or selected_page_id == query.data:
+        logger.warning("Invalid callback data for page selection: %s", query.data)
         await query.edit_message_text(text="Something went wrong. Please try again.")
         return
 
@@ -325,41 +399,28 @@ async def handle_page_selection_callback(
         return
     chat_id = update.effective_chat.id
 
-    selected_page_id = query.data[len(telegram_service.CALLBACK_SELECT_PAGE) :]
-    state, stored_data = get_user_state(chat_id)
-    pending_data = get_pending_summary_data(chat_id)  # Gets data if state is correct
+    # The state check below guarantees this is the pending summary
+    state, pending_data = await get_user_state(chat_id)
 
     if state != STATE_AWAITING_PAGE_SELECTION or not pending_data:
-        logger.warning(f"Received page selection callback in unexpected state: {state}")
+        logger.warning(
+            "Received page selection callback in unexpected state: %s", state
+        )
         await query.edit_message_text(
             text="Your request might have timed out or is out of order. Please send the input again."
         )
-        clear_user_state(chat_id)
+        await clear_user_state(chat_id)
         return
 
-    # Reconstruct needed objects from stored dictionaries
-    try:
-        processing_result = ProcessingResult(**pending_data["processing_result"])
-        page_options_data = pending_data.get("page_options", [])
-        page_options = [NotionPageInfo(**p) for p in page_options_data]
-        selected_page = next(
-            (p for p in page_options if p.id == selected_page_id), None
-        )
-    except Exception as e:
-        logger.error(
-            f"Failed to reconstruct data from state for selection: {e}", exc_info=True
-        )
-        await query.edit_message_text(
-            text="Internal error loading data. Please try again."
-        )
-        clear_user_state(chat_id)
-        return
+    processing_result: ProcessingResult = pending_data.processing_result
+    page_options: List[NotionPageInfo] = pending_data.page_options
+    selected_page = next((p for p in page_options if p.id == selected_page_id), None)
 
     if not selected_page:
-        logger.error(f"Selected page ID {selected_page_id} not found in options.")
+        logger.error("Selected page ID %s not found in options.", selected_page_id)
         await query.edit_message_text(text="Selected page not found. Please try again.")
         # Maybe reshow selection? Or just clear state? Clearing is safer.
-        clear_user_state(chat_id)
+        await clear_user_state(chat_id)
         return
 
     # User selected a page, append summary
@@ -379,9 +440,10 @@ async def handle_page_selection_callback(
             text=f"⚠️ Failed to add summary to Notion page '{selected_page.title}'."
         )
 
-    clear_user_state(chat_id)
+    await clear_user_state(chat_id)
 
 
+@serialized_per_chat
 async def handle_new_page_callback(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -394,8 +456,8 @@ async def handle_new_page_callback(
         return
     chat_id = update.effective_chat.id
 
-    state, stored_data = get_user_state(chat_id)
-    pending_data = get_pending_summary_data(chat_id)  # Gets data if state is correct
+    # The state check below guarantees this is the pending summary
+    state, pending_data = await get_user_state(chat_id)
 
     # Can be triggered from AWAITING_PAGE_SELECTION or directly if no pages existed
     if (
@@ -407,16 +469,16 @@ async def handle_new_page_callback(
             # This state might be set if no pages were found initially
             pass  # Proceed to ask for name
         else:
-            logger.warning(f"Received new page callback in unexpected state: {state}")
+            logger.warning("Received new page callback in unexpected state: %s", state)
             await query.edit_message_text(
                 text="Your request might have timed out or is out of order. Please send the input again."
             )
-            clear_user_state(chat_id)
+            await clear_user_state(chat_id)
             return
 
     # Transition state to wait for the user's text input (the page name)
-    set_user_state(
-        chat_id, STATE_AWAITING_NEW_PAGE_NAME, stored_data
+    await set_user_state(
+        chat_id, STATE_AWAITING_NEW_PAGE_NAME, pending_data
     )  # Keep data, change state
     await telegram_service.request_new_page_name(update, context)
 
@@ -425,7 +487,7 @@ async def handle_new_page_name_input(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
     page_title: str,
-    stored_data: dict,
+    stored_data: PendingSummary,
 ) -> None:
     """Handles the text input after user was prompted for a new page name."""
     if not update.effective_chat:
@@ -440,22 +502,7 @@ async def handle_new_page_name_input(
         # Keep state as STATE_AWAITING_NEW_PAGE_NAME
         return
 
-    # Reconstruct needed objects from stored dictionaries
-    try:
-        processing_result = ProcessingResult(**stored_data["processing_result"])
-    except Exception as e:
-        logger.error(
-            f"Failed to reconstruct data from state for new page creation: {e}",
-            exc_info=True,
-        )
-        await telegram_service.reply_text(
-            update,
-            context,
-            "Internal error loading data. Please try creating the page again.",
-        )
-        clear_user_state(chat_id)
-        return
-
+    processing_result: ProcessingResult = stored_data.processing_result
     summary = processing_result.summary
 
     # Create the new page in Notion
@@ -477,9 +524,10 @@ async def handle_new_page_name_input(
             update, context, f"⚠️ Failed to create Notion page '{page_title}'."
         )
 
-    clear_user_state(chat_id)
+    await clear_user_state(chat_id)
 
 
+@serialized_per_chat
 async def reset_state_command(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -487,8 +535,8 @@ async def reset_state_command(
     if not update.effective_chat:
         return
     chat_id = update.effective_chat.id
-    clear_user_state(chat_id)
-    logger.info(f"State reset requested and performed for chat_id: {chat_id}")
+    await clear_user_state(chat_id)
+    logger.info("State reset requested and performed for chat_id: %s", chat_id)
     await telegram_service.reply_text(
         update,
         context,
@@ -0,0 +1,36 @@
+import logging
+from typing import List
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Pool limits for the Notion and OpenAI clients: keep plenty of warm
+# connections around between messages instead of re-doing TLS handshakes.
+HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=32, max_connections=64, keepalive_expiry=60
+)
+
+_http_clients: List[httpx.AsyncClient] = []
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Creates a pooled HTTP/2 client that is closed on shutdown.
+
+    Each SDK gets its own instance because the Notion SDK rewrites the base URL,
+    headers and timeout of the client it is handed. Timeouts are therefore
+    configured on the SDK clients, not here.
+    """
+    client = httpx.AsyncClient(http2=True, limits=HTTP_LIMITS)
+    _http_clients.append(client)
+    return client
+
+
+async def close_http_clients() -> None:
+    """Closes every client created by create_http_client."""
+    while _http_clients:
+        client = _http_clients.pop()
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("Failed to close HTTP client: %s", e)
@@ -1,13 +1,127 @@
+import asyncio
+import functools
 import logging
-from typing import List, Optional
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+from aiolimiter import AsyncLimiter
 from notion_client import AsyncClient, APIResponseError, APIErrorCode
-from src.config import APP_CONFIG
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from src.config import get_config
 from src.models import Fact, NotionPageInfo
+from src.services.http_service import create_http_client
 
 logger = logging.getLogger(__name__)
 
-# Initialize async Notion client
-notion = AsyncClient(auth=APP_CONFIG.notion_api_key)
+# Max number of Notion requests kept in flight at once, shared by all callers
+NOTION_MAX_CONCURRENT_REQUESTS = 8
+_notion_semaphore = asyncio.Semaphore(NOTION_MAX_CONCURRENT_REQUESTS)
+# Notion allows an average of 3 requests per second per integration; pacing
+# requests up front avoids spending round trips on 429 responses
+NOTION_REQUESTS_PER_SECOND = 3
+_notion_rate_limit = AsyncLimiter(NOTION_REQUESTS_PER_SECOND, 1)
+
+# Notion accepts at most 100 child blocks per append request
+NOTION_MAX_BLOCKS_PER_APPEND = 100
+
+# Per-request timeout; the SDK default of 60s would let a hung call hold the
+# chat lock for minutes across retries
+NOTION_TIMEOUT_MS = 30_000
+
+# Base backoff (seconds) before each retry of a transient Notion failure
+NOTION_RETRY_DELAYS = (1, 2, 5, 15, 30)
+
+# Child pages change rarely, so listings are served from cache for this long
+PAGES_CACHE_TTL_SECONDS = 60.0
+# Older listings are refetched before answering instead of served while a
+# background refresh runs, so an idle bot never offers hours-old pages
+PAGES_CACHE_MAX_STALE_SECONDS = 600.0
+# Structure: {parent_id: (fetched_at, pages)}
+_pages_cache: Dict[str, Tuple[float, List[NotionPageInfo]]] = {}
+# One lock per parent so concurrent callers share a single refresh
+_pages_locks: Dict[str, asyncio.Lock] = {}
+# Bumped on invalidation so a refresh that started earlier can't store its
+# outdated listing afterwards
+_pages_generations: Dict[str, int] = {}
+_background_tasks: set[asyncio.Task] = set()
+
+
+@functools.lru_cache(maxsize=1)
+def get_client() -> AsyncClient:
+    """Returns the shared async Notion client, created on first use."""
+    return AsyncClient(
+        auth=get_config().notion_api_key,
+        client=create_http_client(),
+        timeout_ms=NOTION_TIMEOUT_MS,
+    )
+
+
+def _retry_delay(
+    error: Exception, base_delay: float, retry_on_ambiguous: bool
+) -> Optional[float]:
+    """Returns how long to wait before retrying a failed call, or None to give up.
+
+    Rate limits honor the Retry-After header, capped at the longest retry delay
+    since the wait holds the chat's lock. Server errors and network failures
+    back off with jitter, and anything else (auth, validation, ...) is permanent.
+    Timeouts, dropped connections and server errors are ambiguous: Notion may
+    already have applied the request, so those are only retried when
+    retry_on_ambiguous is set. Writes pass False to avoid duplicating content.
+    """
+    backoff = base_delay * (1 + random.uniform(0, 0.5))
+    if isinstance(error, HTTPResponseError):
+        if error.status == 429:
+            retry_after = error.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), NOTION_RETRY_DELAYS[-1])
+                except ValueError:
+                    pass
+            return backoff
+        if not 500 <= error.status < 600:
+            return None
+    elif isinstance(error, httpx.ConnectError):
+        # The request never reached Notion, so it's safe to send again
+        return backoff
+    return backoff if retry_on_ambiguous else None
+
+
+async def _notion_call(fn, *args, retry_on_ambiguous: bool = True, **kwargs):
+    """Calls a Notion client method, retrying transient failures with backoff.
+
+    Pass retry_on_ambiguous=False for non-idempotent writes (creates, appends).
+    """
+    for attempt, base_delay in enumerate(NOTION_RETRY_DELAYS, start=1):
+        try:
+            async with _notion_rate_limit, _notion_semaphore:
+                return await fn(*args, **kwargs)
+        except (HTTPResponseError, RequestTimeoutError, httpx.TransportError) as e:
+            delay = _retry_delay(e, base_delay, retry_on_ambiguous)
+            if delay is None:
+                raise
+            logger.warning(
+                "Notion request failed (%r), retry %d/%d in %.1fs.",
+                e,
+                attempt,
+                len(NOTION_RETRY_DELAYS),
+                delay,
+            )
+            await asyncio.sleep(delay)
+    # Out of retries, let the last attempt's error reach the caller
+    async with _notion_rate_limit, _notion_semaphore:
+        return await fn(*args, **kwargs)
+
+
+def _rt(text: str) -> dict:
+    """Builds a rich text property value."""
+    return {"rich_text": [{"text": {"content": text}}]}
+
+
+def _title(text: str) -> dict:
+    """Builds a title property value."""
+    return {"title": [{"text": {"content": text}}]}
+
 
 async def add_facts_to_database(facts: List[Fact], source_text: str) -> bool:
     """Adds extracted facts as new pages/entries to the configured Notion database.
@@ -19,144 +133,315 @@ async def add_facts_to_database(facts: List[Fact], source_text: str) -> bool:
     Returns:
         True if all facts were added successfully (or if list was empty), False otherwise.
     """
+    config = get_config()
     if not facts:
         logger.info("No facts provided to add to Notion database.")
         return True
 
-    database_id = APP_CONFIG.notion_facts_database_id
+    database_id = config.notion_facts_database_id
     logger.info(f"Adding {len(facts)} facts to Notion database ID: {database_id}")
-    success = True
+    # Read the property names once instead of per fact
+    prop_subject = config.notion_db_property_subject
+    prop_predicate = config.notion_db_property_predicate
+    prop_object = config.notion_db_property_object
+    prop_context = config.notion_db_property_context
+    prop_source_text = config.notion_db_property_source_text
+
+    # Properties that are the same for every fact are built once per batch
+    # and copied into each fact's properties
+    shared_properties = {}
+    if source_text and prop_source_text:
+        # Limit source text length to avoid Notion API limits (e.g., 2000 chars for rich text)
+        truncated_source = (
+            source_text[:1990] + "..." if len(source_text) > 2000 else source_text
+        )
+        shared_properties[prop_source_text] = _rt(truncated_source)
 
-    for fact in facts:
+    # One bad schema fails every fact the same way, so only the first failure
+    # gets a full traceback; later ones are logged compactly
+    log_traceback = True
+
+    async def add_fact(fact: Fact) -> bool:
+        nonlocal log_traceback
         # Construct Notion page properties based on the database schema
         # Ensure property names match your Notion DB (configured in AppConfig)
         # We assume 'Title' properties exist for subject, predicate, object
         # and 'Rich Text' for context and source_text. Adjust types as needed.
         properties = {
-            APP_CONFIG.notion_db_property_subject: {
-                "title": [{"text": {"content": fact.subject}}]
-            },
-            APP_CONFIG.notion_db_property_predicate: {
-                "rich_text": [{"text": {"content": fact.predicate}}]
-            },  # Using rich_text for flexibility
-            APP_CONFIG.notion_db_property_object: {
-                "rich_text": [{"text": {"content": fact.object}}]
-            },  # Using rich_text for flexibility
+            **shared_properties,
+            prop_subject: _title(fact.subject),
+            # Using rich_text for flexibility
+            prop_predicate: _rt(fact.predicate),
+            prop_object: _rt(fact.object),
         }
         # Add optional fields if they exist and properties are configured
-        if fact.context and APP_CONFIG.notion_db_property_context:
-            properties[APP_CONFIG.notion_db_property_context] = {
-                "rich_text": [{"text": {"content": fact.context}}]
-            }
-        if source_text and APP_CONFIG.notion_db_property_source_text:
-            # Limit source text length to avoid Notion API limits (e.g., 2000 chars for rich text)
-            truncated_source = (
-                source_text[:1990] + "..." if len(source_text) > 2000 else source_text
-            )
-            properties[APP_CONFIG.notion_db_property_source_text] = {
-                "rich_text": [{"text": {"content": truncated_source}}]
-            }
+        if fact.context and prop_context:
+            properties[prop_context] = _rt(fact.context)
 
         try:
-            await notion.pages.create(
+            await _notion_call(
+                get_client().pages.create,
+                retry_on_ambiguous=False,
                 parent={"type": "database_id", "database_id": database_id},
                 properties=properties,
             )
             logger.debug(
                 f"Successfully added fact: {fact.subject} - {fact.predicate} - {fact.object}"
             )
+            return True
         except APIResponseError as e:
             logger.error(
-                f"Notion API error adding fact: {fact}. Error: {e}", exc_info=True
+                "Notion API error adding fact: %s. Error: %r",
+                fact,
+                e,
+                exc_info=log_traceback,
             )
+            log_traceback = False
             # Check for specific errors if needed, e.g., schema mismatch
             if e.code == APIErrorCode.ValidationError:
                 logger.error(
                     "Validation Error: Check if Notion database properties match config (names and types)."
                 )
-            success = False
+            return False
         except Exception as e:
             logger.error(
-                f"Unexpected error adding fact to Notion: {fact}. Error: {e}",
-                exc_info=True,
+                "Unexpected error adding fact to Notion: %s. Error: %r",
+                fact,
+                e,
+                exc_info=log_traceback,
             )
-            success = False
+            log_traceback = False
+            return False
+
+    # Notion has no bulk row endpoint, so send the per-fact requests concurrently
+    results = await asyncio.gather(
+        *(add_fact(fact) for fact in facts), return_exceptions=True
+    )
+    success = True
+    for fact, result in zip(facts, results):
+        if isinstance(result, BaseException):
+            logger.error("Adding fact %s to Notion failed: %r", fact, result)
+        success = success and result is True
 
     logger.info(f"Finished adding facts to Notion. Overall success: {success}")
     return success
 
 
+async def add_facts_as_blocks(page_id: str, facts: List[Fact]) -> bool:
+    """Appends extracted facts as paragraph blocks to a Notion page.
+
+    Unlike add_facts_to_database, this sends one request per 100 facts
+    instead of one request per fact.
+
+    Args:
+        page_id: The ID of the Notion page to append the facts to.
+        facts: A list of Fact objects to add.
+
+    Returns:
+        True if all facts were added successfully (or if list was empty), False otherwise.
+    """
+    if not facts:
+        logger.info("No facts provided to add to Notion page.")
+        return True
+
+    logger.info(
+        "Appending %d facts as blocks to Notion page ID: %s", len(facts), page_id
+    )
+    children = []
+    for fact in facts:
+        rich_text = [
+            {
+                "type": "text",
+                "text": {
+                    "content": f"{fact.subject} — {fact.predicate} — {fact.object}"
+                },
+            }
+        ]
+        if fact.context:
+            rich_text.append(
+                {
+                    "type": "text",
+                    "text": {"content": f" ({fact.context})"},
+                    "annotations": {"italic": True},
+                }
+            )
+        children.append(
+            {
+                "object": "block",
+                "type": "paragraph",
+                "paragraph": {"rich_text": rich_text},
+            }
+        )
+
+    # Chunks are appended one after another so the facts keep their order
+    for start in range(0, len(children), NOTION_MAX_BLOCKS_PER_APPEND):
+        chunk = children[start : start + NOTION_MAX_BLOCKS_PER_APPEND]
+        try:
+            await _notion_call(
+                get_client().blocks.children.append,
+                retry_on_ambiguous=False,
+                block_id=page_id,
+                children=chunk,
+            )
+        except APIResponseError as e:
+            logger.error(
+                "Notion API error appending facts to page %s: %s",
+                page_id,
+                e,
+                exc_info=True,
+            )
+            return False
+        except Exception as e:
+            logger.error(
+                "Unexpected error appending facts to Notion page %s: %s",
+                page_id,
+                e,
+                exc_info=True,
+            )
+            return False
+
+    logger.info("Successfully appended %d facts to page %s.", len(facts), page_id)
+    return True
+
+
 async def list_pages_under_parent() -> List[NotionPageInfo]:
     """
-    Lists pages that are direct children of the configured NOTION_SUMMARY_PARENT_ID
-    using the blocks.children.list endpoint. Filters for child pages.
-    Note: Notion API returns children in a fixed order (usually creation order).
+    Lists pages that are direct children of the configured NOTION_SUMMARY_PARENT_ID.
+    Results are cached per parent for PAGES_CACHE_TTL_SECONDS. Up to
+    PAGES_CACHE_MAX_STALE_SECONDS old, stale pages are returned right away while
+    a background refresh fetches the current ones; older ones are refetched first.
 
     Returns:
         A list of NotionPageInfo objects for the found child pages.
     """
-    parent_id = APP_CONFIG.notion_summary_parent_id
-    logger.info(f"Listing child pages under Notion parent block ID: {parent_id}")
-    pages_info: List[NotionPageInfo] = []
+    parent_id = get_config().notion_summary_parent_id
+    cached = _pages_cache.get(parent_id)
+    if cached is None:
+        return await _refresh_pages_cache(parent_id)
+
+    fetched_at, pages_info = cached
+    age = time.monotonic() - fetched_at
+    if age >= PAGES_CACHE_MAX_STALE_SECONDS:
+        return await _refresh_pages_cache(parent_id)
+
+    lock = _pages_locks.get(parent_id)
+    is_stale = age >= PAGES_CACHE_TTL_SECONDS
+    if is_stale and not (lock and lock.locked()):
+        task = asyncio.create_task(_refresh_pages_cache(parent_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return pages_info
+
+
+async def _refresh_pages_cache(parent_id: str) -> List[NotionPageInfo]:
+    """Fetches the child pages of a parent and stores them in the cache."""
+    lock = _pages_locks.setdefault(parent_id, asyncio.Lock())
+    async with lock:
+        cached = _pages_cache.get(parent_id)
+        if cached and time.monotonic() - cached[0] < PAGES_CACHE_TTL_SECONDS:
+            # Another caller refreshed the pages while we waited for the lock
+            return cached[1]
+        generation = _pages_generations.get(parent_id, 0)
+        pages_info = await _fetch_pages_under_parent(parent_id)
+        if pages_info is None:
+            # Notion error, keep serving the stale pages if there are any
+            return cached[1] if cached else []
+        if _pages_generations.get(parent_id, 0) == generation:
+            _pages_cache[parent_id] = (time.monotonic(), pages_info)
+        return pages_info
+
+
+def invalidate_pages_cache(parent_id: str) -> None:
+    """Drops the cached child pages of a parent so the next lookup hits Notion."""
+    _pages_generations[parent_id] = _pages_generations.get(parent_id, 0) + 1
+    _pages_cache.pop(parent_id, None)
+
+
+async def _iter_child_pages(parent_id: str) -> AsyncIterator[NotionPageInfo]:
+    """
+    Yields the child pages of a parent block using the blocks.children.list
+    endpoint, page by page as Notion returns them.
+    Note: Notion API returns children in a fixed order (usually creation order).
+    Errors from the Notion API are propagated to the caller.
+    """
     next_cursor: Optional[str] = None
-    has_more: bool = True
+    while True:
+        # Use blocks.children.list to get children of the parent page/block
+        response = await _notion_call(
+            get_client().blocks.children.list,
+            block_id=parent_id,
+            page_size=100,  # Request the maximum allowed page size
+            start_cursor=next_cursor,
+        )
 
-    while has_more:
-        try:
-            # Use blocks.children.list to get children of the parent page/block
-            response = await notion.blocks.children.list(
-                block_id=parent_id,
-                page_size=100, # Request the maximum allowed page size
-                start_cursor=next_cursor
-            )
+        results = response.get("results", [])
+        logger.debug(
+            "Retrieved %d child blocks (cursor: %s).", len(results), next_cursor
+        )
 
-            results = response.get("results", [])
-            logger.debug(f"Retrieved {len(results)} child blocks (cursor: {next_cursor}).")
-
-            for block in results:
-                # We are only interested in blocks of type 'child_page'
-                # Other types could be 'paragraph', 'heading_1', 'child_database', etc.
-                if block.get("object") == "block" and block.get("type") == "child_page":
-                    page_id = block.get("id")
-                    # The title for a child_page block is directly available in the response
-                    page_title = block.get("child_page", {}).get("title", "Untitled")
-
-                    if page_id:
-                        pages_info.append(NotionPageInfo(id=page_id, title=page_title))
-                        logger.debug(f"Found child page: ID={page_id}, Title='{page_title}'")
-                    else:
-                         logger.warning(f"Found child_page block without an ID: {block}")
-                # else:
-                    # Log other block types if needed for debugging
-                    # logger.debug(f"Skipping non-child_page block: Type={block.get('type')}, ID={block.get('id')}")
-
-            # Handle pagination
-            has_more = response.get("has_more", False)
-            next_cursor = response.get("next_cursor")
-            if not has_more:
-                logger.debug("No more child blocks to fetch.")
-                break # Exit the while loop
+        for block in results:
+            # We are only interested in blocks of type 'child_page'
+            # Other types could be 'paragraph', 'heading_1', 'child_database', etc.
+            if block.get("object") == "block" and block.get("type") == "child_page":
+                page_id = block.get("id")
+                # The title for a child_page block is directly available in the response
+                page_title = block.get("child_page", {}).get("title", "Untitled")
+
+                if page_id:
+                    logger.debug(
+                        "Found child page: ID=%s, Title='%s'", page_id, page_title
+                    )
+                    yield NotionPageInfo(id=page_id, title=page_title)
+                else:
+                    logger.warning("Found child_page block without an ID: %s", block)
+
+        # Handle pagination
+        next_cursor = response.get("next_cursor")
+        if not response.get("has_more", False) or not next_cursor:
+            logger.debug("No more child blocks to fetch.")
+            return
+
+
+async def _fetch_pages_under_parent(
+    parent_id: str,
+) -> Optional[List[NotionPageInfo]]:
+    """
+    Lists the child pages of a parent block, sorted alphabetically.
 
-        except APIResponseError as e:
-            logger.error(f"Notion API error listing children for block {parent_id}: {e}", exc_info=True)
-            if e.code == APIErrorCode.ObjectNotFound:
-                logger.error(f"Parent block/page with ID '{parent_id}' not found or the integration lacks access.")
-            elif e.code == APIErrorCode.ValidationError:
-                 logger.error(f"Validation error, likely '{parent_id}' is not a valid block ID.")
-            # Stop processing if an error occurs
-            has_more = False # Prevent potential infinite loop on persistent error
-            # Return empty list or re-raise depending on desired behavior
-            return [] # Return empty list on error
-        except Exception as e:
-            logger.error(f"Unexpected error listing Notion child pages for parent {parent_id}: {e}", exc_info=True)
-            has_more = False # Prevent potential infinite loop
-            return [] # Return empty list on unexpected error
+    Returns:
+        A list of NotionPageInfo objects, or None on error (so that a parent
+        without child pages can be told apart from a failed request).
+    """
+    logger.info(f"Listing child pages under Notion parent block ID: {parent_id}")
+    try:
+        pages_info = [page async for page in _iter_child_pages(parent_id)]
+    except APIResponseError as e:
+        logger.error(
+            f"Notion API error listing children for block {parent_id}: {e}",
+            exc_info=True,
+        )
+        if e.code == APIErrorCode.ObjectNotFound:
+            logger.error(
+                f"Parent block/page with ID '{parent_id}' not found or the integration lacks access."
+            )
+        elif e.code == APIErrorCode.ValidationError:
+            logger.error(
+                f"Validation error, likely '{parent_id}' is not a valid block ID."
+            )
+        return None
+    except Exception as e:
+        logger.error(
+            f"Unexpected error listing Notion child pages for parent {parent_id}: {e}",
+            exc_info=True,
+        )
+        return None
 
     logger.info(f"Found {len(pages_info)} child pages under parent {parent_id}.")
 
     # The API doesn't guarantee order by last edited time here.
     # We might want to sort them alphabetically for consistent display.
-    pages_info.sort(key=lambda p: p.title.lower())
+    # casefold() gives caseless matching for non-ASCII titles too
+    pages_info.sort(key=lambda p: p.title.casefold())
     logger.debug(f"Sorted child pages alphabetically: {[p.title for p in pages_info]}")
 
     return pages_info
@@ -176,7 +461,9 @@ async def append_text_to_page(page_id: str, text_to_append: str) -> bool:
     logger.info(f"Appending text to Notion page ID: {page_id}")
     try:
         # Append as a new paragraph block
-        await notion.blocks.children.append(
+        await _notion_call(
+            get_client().blocks.children.append,
+            retry_on_ambiguous=False,
             block_id=page_id,
             children=[
                 {
@@ -218,7 +505,8 @@ async def create_notion_page(
     Returns:
         NotionPageInfo of the created page, or None on failure.
     """
-    parent_id = APP_CONFIG.notion_summary_parent_id
+    config = get_config()
+    parent_id = config.notion_summary_parent_id
     logger.info(f"Creating new Notion page '{title}' under parent {parent_id}")
 
     # Determine parent type (page or database) for the API call
@@ -233,7 +521,9 @@ async def create_notion_page(
     title_property_name = "title"  # Default assumption
 
     try:
-        create_response = await notion.pages.create(
+        create_response = await _notion_call(
+            get_client().pages.create,
+            retry_on_ambiguous=False,
             parent=parent_structure,
             properties={
                 title_property_name: {
@@ -257,6 +547,7 @@ async def create_notion_page(
             logger.info(
                 f"Successfully created Notion page: ID={page_id}, Title='{title}'"
             )
+            invalidate_pages_cache(parent_id)  # Show the new page in the next listing
             return NotionPageInfo(id=page_id, title=title)
         else:
             logger.error("Notion page creation response did not contain an ID.")
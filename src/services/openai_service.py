@@ -1,19 +1,92 @@
+import functools
+import io
 import logging
-import json
-from typing import Optional
-from openai import AsyncOpenAI, OpenAIError
-from src.config import APP_CONFIG
+import os
+from typing import BinaryIO, List, Optional
+import aiofiles
+import json_repair
+import orjson
+from openai import DEFAULT_TIMEOUT, AsyncOpenAI, OpenAIError
+from pydantic import TypeAdapter, ValidationError
+from src.config import get_config
 from src.models import Fact, ProcessingResult
+from src.services.http_service import create_http_client
 
 logger = logging.getLogger(__name__)
 
-# Initialize async client
-aclient = AsyncOpenAI(api_key=APP_CONFIG.openai_api_key)
+# Compiled once, validates a whole list of facts in a single pass
+FACTS_ADAPTER = TypeAdapter(List[Fact])
+
+
+def _strict_object_schema(schema: dict) -> dict:
+    """Adapts a Pydantic object schema to OpenAI's strict structured outputs.
+
+    Strict mode requires every property to be listed as required (optional
+    fields stay nullable) and forbids extra keys and defaults.
+    """
+    properties = {
+        name: {key: value for key, value in prop.items() if key != "default"}
+        for name, prop in schema["properties"].items()
+    }
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+# The model's output is constrained to this schema server-side, so the prompt
+# doesn't need to spell it out. Built once at import time.
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "audit_output",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "english_text": {"type": "string"},
+                "facts": {
+                    "type": "array",
+                    "items": _strict_object_schema(Fact.model_json_schema()),
+                },
+                "summary": {"type": "string"},
+            },
+            "required": ["english_text", "facts", "summary"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+SYSTEM_PROMPT = """
+You are an AI assistant helping a user audit their life. Your tasks are to:
+1.  Analyze the user's input text.
+2.  Ensure the core meaning is represented in English. If the input is already English, keep it. If it's another language (like Hebrew), translate its meaning accurately to English.
+3.  Extract key facts and important information from the English text. Facts should represent relationships or attributes, primarily focusing on people or important entities. Structure each fact with a 'subject', 'predicate', and 'object'. Set 'context' to the surrounding phrase, or null if there is none.
+4.  Generate a very concise, clear summary of the English text, capturing the main points without extra words.
+
+Respond with a single JSON object containing three keys:
+- "english_text": The English version of the input text.
+- "facts": The extracted facts. If no facts are found, return an empty array [].
+- "summary": A string containing the concise summary.
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def get_client() -> AsyncOpenAI:
+    """Returns the shared async OpenAI client, created on first use."""
+    # Keep the SDK's long read timeout, transcriptions and completions can be slow
+    return AsyncOpenAI(
+        api_key=get_config().openai_api_key,
+        http_client=create_http_client(),
+        timeout=DEFAULT_TIMEOUT,
+    )
 
 
 async def transcribe_audio(audio_file_path: str) -> Optional[str]:
     """
-    Transcribes audio using OpenAI Whisper. Detects language automatically.
+    Transcribes an audio file on disk using OpenAI Whisper.
     Args:
         audio_file_path: Path to the audio file (e.g., .ogg, .mp3, .wav).
     Returns:
@@ -21,14 +94,35 @@ async def transcribe_audio(audio_file_path: str) -> Optional[str]:
     """
     logger.info(f"Transcribing audio file: {audio_file_path}")
     try:
-        with open(audio_file_path, "rb") as audio_file:
-            # Use the async client's transcription method
-            transcript = await aclient.audio.transcriptions.create(
-                model=APP_CONFIG.openai_model_whisper,
-                file=audio_file,
-                # language="en" # Optional: Specify if needed, but Whisper is good at auto-detect
-                response_format="text",  # Get plain text directly
-            )
+        # Read without blocking the event loop, then upload from memory
+        async with aiofiles.open(audio_file_path, "rb") as f:
+            audio_file = io.BytesIO(await f.read())
+    except OSError as e:
+        logger.error(f"Failed to open audio file {audio_file_path}: {e}")
+        return None
+    audio_file.name = os.path.basename(audio_file_path)
+    return await transcribe_audio_bytes(audio_file)
+
+
+async def transcribe_audio_bytes(audio_file: BinaryIO) -> Optional[str]:
+    """
+    Transcribes in-memory audio using OpenAI Whisper. Detects language automatically.
+    Args:
+        audio_file: A binary file-like object positioned at the start of the audio.
+            Its `name` attribute should carry a supported extension (e.g., .ogg).
+    Returns:
+        The transcribed text, or None if an error occurred.
+    """
+    config = get_config()
+    logger.info("Transcribing audio...")
+    try:
+        # Use the async client's transcription method
+        transcript = await get_client().audio.transcriptions.create(
+            model=config.openai_model_whisper,
+            file=audio_file,
+            # language="en" # Optional: Specify if needed, but Whisper is good at auto-detect
+            response_format="text",  # Get plain text directly
+        )
         # The response for 'text' format is directly the string
         logger.info("Transcription successful.")
         logger.debug(f"Transcription result: {transcript[:100]}...")  # Log truncated
@@ -44,6 +138,15 @@ async def transcribe_audio(audio_file_path: str) -> Optional[str]:
         return None
 
 
+def _validate_fact(fact_data) -> Optional[Fact]:
+    """Validates a single raw fact, returning None (and logging) if it's invalid."""
+    try:
+        return Fact.model_validate(fact_data)
+    except ValidationError as e:
+        logger.warning("Skipping invalid fact data: %s. Error: %s", fact_data, e)
+        return None
+
+
 async def process_text_with_llm(original_text: str) -> Optional[ProcessingResult]:
     """
     Processes the input text using an LLM (e.g., GPT-4o) to:
@@ -57,39 +160,29 @@ async def process_text_with_llm(original_text: str) -> Optional[ProcessingResult
     Returns:
         A ProcessingResult object containing english text, facts, and summary, or None on failure.
     """
+    config = get_config()
     logger.info("Processing text with LLM...")
 
-    # Define the desired JSON structure for facts
-    fact_schema = Fact.model_json_schema()
-    facts_output_format = {"type": "array", "items": fact_schema}
-
-    system_prompt = f"""
-You are an AI assistant helping a user audit their life. Your tasks are to:
-1.  Analyze the user's input text.
-2.  Ensure the core meaning is represented in English. If the input is already English, keep it. If it's another language (like Hebrew), translate its meaning accurately to English.
-3.  Extract key facts and important information from the English text. Facts should represent relationships or attributes, primarily focusing on people or important entities. Structure each fact as a JSON object with keys 'subject', 'predicate', and 'object'. Optionally include a 'context' string with the surrounding phrase.
-4.  Generate a very concise, clear summary of the English text, capturing the main points without extra words.
-
-Respond with a single JSON object containing three keys:
-- "english_text": The English version of the input text.
-- "facts": A JSON array of extracted fact objects matching the schema: {json.dumps(facts_output_format)}. If no facts are found, return an empty array [].
-- "summary": A string containing the concise summary.
-"""
-
     user_prompt = f"Process the following text:\n\n{original_text}"
 
     try:
-        response = await aclient.chat.completions.create(
-            model=APP_CONFIG.openai_model_gpt,
+        stream = await get_client().chat.completions.create(
+            model=config.openai_model_gpt,
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt},
             ],
-            response_format={"type": "json_object"},  # Use JSON mode
+            response_format=RESPONSE_FORMAT,  # Strict structured outputs
             temperature=0.2,  # Lower temperature for more deterministic results
+            stream=True,
         )
 
-        content = response.choices[0].message.content
+        # Accumulate the streamed tokens; the JSON is only parsed once complete
+        content_parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                content_parts.append(chunk.choices[0].delta.content)
+        content = "".join(content_parts)
         if not content:
             logger.error("LLM returned empty content.")
             return None
@@ -98,24 +191,23 @@ Respond with a single JSON object containing three keys:
 
         # Parse the JSON response
         try:
-            result_data = json.loads(content)
-        except json.JSONDecodeError as e:
-            logger.error(
-                f"Failed to decode LLM JSON response: {e}. Response: {content}"
-            )
-            # Fallback: Try to extract summary even if JSON is broken
-            # This is a basic fallback, more robust parsing could be added
-            summary_fallback = (
-                content.split('"summary": "')[-1].split('"')[0]
-                if '"summary": "' in content
-                else "Summary extraction failed."
-            )
-            return ProcessingResult(
-                original_text=original_text,
-                english_text="Translation/Fact extraction failed.",
-                facts=[],
-                summary=summary_fallback,
+            result_data = orjson.loads(content)
+        except orjson.JSONDecodeError as e:
+            logger.warning(
+                "Failed to decode LLM JSON response: %s. Attempting repair.", e
             )
+            # Fallback: repair truncated/malformed JSON (unclosed strings, missing
+            # brackets, trailing commas) so the fields that did arrive survive.
+            # Take the repaired object directly instead of a re-serialized string
+            result_data = json_repair.repair_json(content, return_objects=True)
+            if not isinstance(result_data, dict):
+                logger.error("Could not repair LLM JSON response: %s", content)
+                return ProcessingResult(
+                    original_text=original_text,
+                    english_text="Translation/Fact extraction failed.",
+                    facts=[],
+                    summary="Summary extraction failed.",
+                )
 
         # Validate and create Pydantic models
         english_text = result_data.get(
@@ -125,19 +217,13 @@ Respond with a single JSON object containing three keys:
         raw_facts = result_data.get("facts", [])
         facts = []
         if isinstance(raw_facts, list):
-            for fact_data in raw_facts:
-                try:
-                    # Only include facts with all required fields
-                    if isinstance(fact_data, dict) and all(
-                        k in fact_data for k in ["subject", "predicate", "object"]
-                    ):
-                        facts.append(Fact(**fact_data))
-                    else:
-                        logger.warning(f"Skipping invalid fact data: {fact_data}")
-                except Exception as e:  # Catch Pydantic validation errors or others
-                    logger.warning(
-                        f"Failed to parse fact data: {fact_data}. Error: {e}"
-                    )
+            try:
+                facts = FACTS_ADAPTER.validate_python(raw_facts)
+            except ValidationError:
+                # Keep the valid facts instead of dropping the whole batch
+                facts = [
+                    fact for fact in map(_validate_fact, raw_facts) if fact is not None
+                ]
         else:
             logger.warning(f"LLM returned 'facts' not as a list: {raw_facts}")
 
@@ -1,5 +1,11 @@
+import functools
 import logging
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Any, Optional, Protocol, Tuple, List
+import msgspec
+from cachetools import TTLCache
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from src.config import get_config
 from src.models import NotionPageInfo, ProcessingResult
 
 logger = logging.getLogger(__name__)
@@ -10,57 +16,155 @@ STATE_AWAITING_PAGE_CONFIRMATION = "AWAITING_PAGE_CONFIRMATION"
 STATE_AWAITING_PAGE_SELECTION = "AWAITING_PAGE_SELECTION"
 STATE_AWAITING_NEW_PAGE_NAME = "AWAITING_NEW_PAGE_NAME"
 
-# Structure: {chat_id: (state, data)}
-_user_states: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+# Abandoned conversations expire instead of being held forever
+USER_STATE_MAX_CHATS = 10_000
+USER_STATE_TTL_SECONDS = 3600
 
+REDIS_KEY_PREFIX = "auditlife:state:"
 
-def set_user_state(
-    chat_id: int, state: str, data: Optional[Dict[str, Any]] = None
+
+class PendingSummary(msgspec.Struct, frozen=True):
+    """A processed input waiting for the user to pick its summary page."""
+
+    processing_result: ProcessingResult
+    suggested_page: Optional[NotionPageInfo] = None
+    page_options: List[NotionPageInfo] = []
+
+
+class UserState(msgspec.Struct, frozen=True):
+    """The conversation state of a chat and the data that goes with it."""
+
+    state: str
+    data: Optional[PendingSummary] = None
+
+
+class StateStore(Protocol):
+    """Storage for per-chat conversation state."""
+
+    async def get(self, chat_id: int) -> Optional[UserState]: ...
+
+    async def set(self, chat_id: int, user_state: UserState) -> None: ...
+
+    async def delete(self, chat_id: int) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class InMemoryStore:
+    """Keeps state in this process. Lost on restart, not shared between workers."""
+
+    def __init__(self) -> None:
+        self._states: TTLCache[int, UserState] = TTLCache(
+            maxsize=USER_STATE_MAX_CHATS, ttl=USER_STATE_TTL_SECONDS
+        )
+
+    async def get(self, chat_id: int) -> Optional[UserState]:
+        return self._states.get(chat_id)
+
+    async def set(self, chat_id: int, user_state: UserState) -> None:
+        self._states[chat_id] = user_state
+
+    async def delete(self, chat_id: int) -> None:
+        self._states.pop(chat_id, None)
+
+    async def close(self) -> None:
+        pass
+
+
+def _enc_hook(obj: Any) -> Any:
+    """Lets msgspec encode the Pydantic models nested in the state."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise NotImplementedError(f"Cannot encode {type(obj)}")
+
+
+def _dec_hook(type_: type, obj: Any) -> Any:
+    """Lets msgspec rebuild the Pydantic models nested in the state."""
+    if isinstance(type_, type) and issubclass(type_, BaseModel):
+        return type_.model_validate(obj)
+    raise NotImplementedError(f"Cannot decode {type_}")
+
+
+class RedisStore:
+    """Keeps state in Redis as MessagePack, so it survives restarts and can be
+    shared by several bot workers."""
+
+    def __init__(self, redis: Redis) -> None:
+        self._redis = redis
+        self._encoder = msgspec.msgpack.Encoder(enc_hook=_enc_hook)
+        self._decoder = msgspec.msgpack.Decoder(UserState, dec_hook=_dec_hook)
+
+    async def get(self, chat_id: int) -> Optional[UserState]:
+        raw = await self._redis.get(f"{REDIS_KEY_PREFIX}{chat_id}")
+        if raw is None:
+            return None
+        try:
+            return self._decoder.decode(raw)
+        except (msgspec.DecodeError, ValueError) as e:
+            logger.warning("Discarding unreadable state for chat %s: %s", chat_id, e)
+            return None
+
+    async def set(self, chat_id: int, user_state: UserState) -> None:
+        await self._redis.set(
+            f"{REDIS_KEY_PREFIX}{chat_id}",
+            self._encoder.encode(user_state),
+            ex=USER_STATE_TTL_SECONDS,
+        )
+
+    async def delete(self, chat_id: int) -> None:
+        await self._redis.delete(f"{REDIS_KEY_PREFIX}{chat_id}")
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+@functools.lru_cache(maxsize=1)
+def get_state_store() -> StateStore:
+    """Returns the state store, Redis if REDIS_URL is set, otherwise in-memory."""
+    redis_url = get_config().redis_url
+    if redis_url:
+        logger.info("Storing conversation state in Redis.")
+        return RedisStore(Redis.from_url(redis_url))
+    return InMemoryStore()
+
+
+async def close_state_store() -> None:
+    """Closes the state store's connections, if it was ever created."""
+    if get_state_store.cache_info().currsize:
+        await get_state_store().close()
+
+
+async def set_user_state(
+    chat_id: int, state: str, data: Optional[PendingSummary] = None
 ) -> None:
     """Sets the state and associated data for a user."""
-    _user_states[chat_id] = (state, data or {})
-    logger.debug(f"State for chat {chat_id} set to {state} with data: {data}")
+    await get_state_store().set(chat_id, UserState(state, data))
+    logger.debug("State for chat %s set to %s with data: %s", chat_id, state, data)
 
 
-def get_user_state(chat_id: int) -> Tuple[str, Dict[str, Any]]:
+async def get_user_state(chat_id: int) -> Tuple[str, Optional[PendingSummary]]:
     """Gets the current state and data for a user, defaults to IDLE."""
-    return _user_states.get(chat_id, (STATE_IDLE, {}))
+    user_state = await get_state_store().get(chat_id)
+    if user_state is None:
+        return STATE_IDLE, None
+    return user_state.state, user_state.data
 
 
-def clear_user_state(chat_id: int) -> None:
+async def clear_user_state(chat_id: int) -> None:
     """Resets the state for a user to IDLE."""
-    if chat_id in _user_states:
-        del _user_states[chat_id]
-        logger.debug(f"State for chat {chat_id} cleared.")
+    await get_state_store().delete(chat_id)
+    logger.debug("State for chat %s cleared.", chat_id)
 
 
 # --- Helper functions to manage specific data within state ---
 
 
-def store_pending_summary_data(
+async def store_pending_summary_data(
     chat_id: int,
     processing_result: ProcessingResult,
     suggested_page: NotionPageInfo,
     page_options: List[NotionPageInfo],
 ) -> None:
     """Stores data needed during the page confirmation/selection process."""
-    data = {
-        "processing_result": processing_result.model_dump(),  # Store as dict for serialization if needed later
-        "suggested_page": suggested_page.model_dump(),
-        "page_options": [p.model_dump() for p in page_options],
-    }
-    set_user_state(chat_id, STATE_AWAITING_PAGE_CONFIRMATION, data)
-
-
-def get_pending_summary_data(chat_id: int) -> Optional[Dict[str, Any]]:
-    """Retrieves stored data if the user is in a relevant state."""
-    state, data = get_user_state(chat_id)
-    if state in [
-        STATE_AWAITING_PAGE_CONFIRMATION,
-        STATE_AWAITING_PAGE_SELECTION,
-        STATE_AWAITING_NEW_PAGE_NAME,
-    ]:
-        # Reconstruct Pydantic models if needed, though often dicts are fine here
-        # For simplicity, we'll work with dicts retrieved from state
-        return data
-    return None
+    data = PendingSummary(processing_result, suggested_page, page_options)
+    await set_user_state(chat_id, STATE_AWAITING_PAGE_CONFIRMATION, data)